@@ -1,74 +1,628 @@
-import cv2
-import base64
 import asyncio
 import time
-import requests
-import gc
+from pathlib import Path
 from typing import Dict, Any, Optional, List
-import numpy as np
 import platform
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# pybase64 uses SIMD paths and is a drop-in replacement for the stdlib module
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+JPEG_QUALITY = 75
+MAX_FRAME_WIDTH = 1280
+
+# How long opening a stream may take before the probe gives up on it
+OPEN_TIMEOUT_MS = 5000
+
+# An MJPEG passthrough image still incomplete past this size is treated as corrupt and dropped
+MAX_MJPEG_IMAGE_BYTES = 16 * 1024 * 1024
+
+# JPEG start-of-frame markers (SOF0-SOF15, excluding DHT, JPG and DAC) carry the image size
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _jpeg_size(data) -> Optional[tuple]:
+    """Read (width, height) from a JPEG's frame header without decoding it"""
+    i = 2
+    length = len(data)
+    while i + 9 <= length:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker in _JPEG_SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+def _jpeg_end(data, start: int, resume: Optional[tuple] = None) -> tuple:
+    """Find where the JPEG whose SOI is at start ends, by walking its marker segments
+
+    Segments are skipped by their length, so the EOI of a thumbnail embedded in an APPn (EXIF)
+    segment isn't mistaken for the image's own. Returns (end, resume): end is the index just past
+    the EOI, -1 if the image isn't complete yet, or 0 if it is malformed. For an incomplete image,
+    passing resume back in once more data has arrived continues the walk where it stopped.
+    """
+    i, in_scan = resume or (start + 2, False)
+    length = len(data)
+    while True:
+        if in_scan:
+            # Entropy-coded data runs up to the first 0xFF that isn't byte stuffing (0xFF00),
+            # a restart marker or fill
+            i = data.find(b'\xff', i)
+            if i < 0:
+                return -1, (length, True)
+            if i + 2 > length:
+                return -1, (i, True)
+            following = data[i + 1]
+            if following == 0x00 or 0xD0 <= following <= 0xD7:
+                i += 2
+                continue
+            if following == 0xFF:
+                i += 1
+                continue
+            in_scan = False
+        
+        if i + 2 > length:
+            return -1, (i, False)
+        if data[i] != 0xFF:
+            return 0, None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+        elif marker == 0xD9:
+            return i + 2, None
+        elif marker == 0xD8:
+            # Another image starts before this one ended
+            return 0, None
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+        elif i + 4 > length:
+            return -1, (i, False)
+        else:
+            i += 2 + ((data[i + 2] << 8) | data[i + 3])
+            in_scan = marker == 0xDA
+
+def _detect_hw_decoder() -> Optional[str]:
+    """Detect which family of GStreamer hardware decoders this machine can use"""
+    if platform.system() != 'Linux':
+        return None
+    if os.path.exists('/etc/nv_tegra_release'):
+        return 'jetson'
+    if glob.glob('/dev/nvidia*'):
+        return 'nvidia'
+    if shutil.which('vainfo') or glob.glob('/dev/dri/renderD*'):
+        return 'vaapi'
+    return None
+
+HW_DECODER = _detect_hw_decoder()
+
+# OpenCV (and NumPy with it) is imported on first camera use, not when the plugin is loaded;
+# the capabilities below are probed at that point by _load_cv2()
+cv2 = None
+np = None
+GSTREAMER_AVAILABLE = False
+CUDA_AVAILABLE = False
+USB_BACKEND = None
+_cv2_lock = threading.Lock()
+
+def _cuda_available(opencv) -> bool:
+    """Check whether this OpenCV build can run cv2.cuda operations on a GPU"""
+    try:
+        return opencv.cuda.getCudaEnabledDeviceCount() > 0
+    except Exception:
+        return False
+
+def _load_cv2():
+    """Import OpenCV and NumPy on first use and probe what this OpenCV build supports"""
+    global cv2, np, GSTREAMER_AVAILABLE, CUDA_AVAILABLE, USB_BACKEND
+    with _cv2_lock:
+        if cv2 is not None:
+            return cv2
+        
+        import numpy
+        import cv2 as opencv
+        
+        GSTREAMER_AVAILABLE = re.search(r'GStreamer:\s*YES', opencv.getBuildInformation()) is not None
+        CUDA_AVAILABLE = _cuda_available(opencv)
+        # Native capture backends for USB cameras; the default pick isn't always the low-latency one
+        USB_BACKEND = {'Linux': opencv.CAP_V4L2, 'Windows': opencv.CAP_DSHOW}.get(platform.system(), opencv.CAP_ANY)
+        
+        np = numpy
+        # Published last: a non-None cv2 means the probes above are done
+        cv2 = opencv
+        return cv2
+
+# Low-latency FFmpeg options for RTSP: TCP transport, no input buffering
+RTSP_FFMPEG_OPTIONS = 'rtsp_transport;tcp|fflags;nobuffer|flags;low_delay'
+
+def _config_dir() -> Path:
+    """Per-user configuration directory for EZ-Robotics"""
+    if platform.system() == 'Windows' and os.environ.get('APPDATA'):
+        return Path(os.environ['APPDATA']) / 'ez-robotics'
+    return Path(os.environ.get('XDG_CONFIG_HOME') or Path.home() / '.config') / 'ez-robotics'
+
+def _redact_url(url: str, password: Optional[str]) -> str:
+    """Mask the password in a camera URL; an empty password is left alone, since replacing '' would star every character"""
+    return url.replace(password, '***') if password else url
+
+# Decoder stages per hardware family, ending in raw frames OpenCV can convert
+_HW_DECODE_STAGES = {
+    'vaapi': {
+        'h264': 'vaapih264dec ! vaapipostproc format=bgrx',
+        'mjpeg': 'vaapijpegdec',
+    },
+    'jetson': {
+        'h264': 'nvv4l2decoder ! nvvidconv',
+        'mjpeg': 'nvv4l2decoder mjpeg=1 ! nvvidconv',
+    },
+    'nvidia': {
+        'h264': 'nvh264dec',
+        'mjpeg': 'nvjpegdec',
+    },
+}
+
+_APPSINK = 'videoconvert ! video/x-raw,format=BGR ! appsink max-buffers=1 drop=true sync=false'
+
+def _gstreamer_pipeline(url: str, stream_format: Optional[str], fps: Optional[float] = None) -> Optional[str]:
+    """Build a hardware-decoding GStreamer pipeline for a stream URL, if supported here"""
+    if not GSTREAMER_AVAILABLE or not HW_DECODER or not stream_format:
+        return None
+    
+    decode = _HW_DECODE_STAGES[HW_DECODER][stream_format]
+    sink = _APPSINK
+    if fps:
+        # Drop surplus frames right after decoding instead of converting them
+        sink = f'videorate ! video/x-raw,framerate={round(fps * 1000)}/1000 ! {sink}'
+    
+    if stream_format == 'h264':
+        return f'rtspsrc location="{url}" latency=0 ! rtph264depay ! h264parse ! {decode} ! {sink}'
+    return f'souphttpsrc location="{url}" is-live=true ! multipartdemux ! jpegparse ! {decode} ! {sink}'
+
+def _b64encode_view(view) -> str:
+    return base64.b64encode(view).decode('ascii')
+
+class FrameRing:
+    """Fixed set of reusable JPEG slots written by one reader thread and read by the streamer"""
+    
+    def __init__(self, slots: int = 4, slot_size: int = 1 << 20):
+        self._buffers = [bytearray(slot_size) for _ in range(slots)]
+        self._sizes = [0] * slots
+        self._seqs = [0] * slots
+        self._head = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def head(self) -> int:
+        """Sequence number of the newest published frame (0 before the first one)"""
+        return self._head
+    
+    def write(self, jpeg) -> int:
+        """Copy an encoded frame (any bytes-like object, e.g. cv2.imencode's array) into the next slot and publish it"""
+        # imencode returns an (N, 1) uint8 array, which bytearray slices won't accept directly
+        jpeg = memoryview(jpeg).cast('B')
+        seq = self._head + 1
+        index = seq % len(self._buffers)
+        size = jpeg.nbytes
+        
+        with self._lock:
+            # Readers of this slot's previous frame will see it was overwritten
+            self._seqs[index] = -1
+            if size > len(self._buffers[index]):
+                self._buffers[index] = bytearray(size)
+        
+        self._buffers[index][:size] = jpeg
+        
+        with self._lock:
+            self._sizes[index] = size
+            self._seqs[index] = seq
+            self._head = seq
+        return seq
+    
+    def read_latest(self, consume, after: int = 0):
+        """Call consume() on a view of the newest frame newer than `after`; returns (seq, result) or None"""
+        while True:
+            with self._lock:
+                seq = self._head
+                if seq <= after:
+                    return None
+                index = seq % len(self._buffers)
+                buffer = self._buffers[index]
+                size = self._sizes[index]
+            
+            with memoryview(buffer)[:size] as view:
+                result = consume(view)
+            
+            with self._lock:
+                if self._seqs[index] == seq:
+                    return seq, result
+            # The writer lapped us while we were reading; retry with the newest frame
 
 class UniversalCameraStream:
-    def __init__(self):
+    # Common RTSP URL patterns
+    _RTSP_TEMPLATES = (
+        "rtsp://{username}:{password}@{ip}:{port}/stream1",
+        "rtsp://{username}:{password}@{ip}:{port}/stream2",
+        "rtsp://{username}:{password}@{ip}/stream1",
+        "rtsp://{username}:{password}@{ip}/stream2",
+        "rtsp://{username}:{password}@{ip}:{port}/h264",
+        "rtsp://{username}:{password}@{ip}:{port}/live",
+        "rtsp://{username}:{password}@{ip}:{port}/video.mp4",
+    )
+    
+    # Common MJPEG URL patterns
+    _MJPEG_TEMPLATES = (
+        "http://{ip}:{port}/video.mjpg",
+        "http://{ip}:{port}/mjpg/video.mjpg",
+        "http://{ip}:{port}/video.cgi",
+        "http://{ip}:{port}/mjpeg",
+        "http://{ip}:{port}/video",
+        "http://{ip}:{port}/stream.mjpg",
+    )
+    
+    def __init__(self, registry: 'CameraRegistry', stream_id: str = 'default'):
+        self.registry = registry
+        self.stream_id = stream_id
         self.cap = None
         self.streaming = False
         self.camera_url = None
+        # Credential-free copy of camera_url, built once on connect for status and logs
+        self._display_url = None
         self.frame_count = 0
         self.camera_type = None
         self.camera_settings = {}
         
+        # Working URL template per camera, so reconnects skip the full pattern probe
+        self._url_cache_path = _config_dir() / 'camera_url_cache.json'
+        self._url_cache = self._load_url_cache()
+        
+        # Reader thread keeps draining the capture and encodes the frames a stream will send
+        # into a ring of reusable slots, so the streaming loop only picks up finished JPEGs
+        self._reader_thread = None
+        # Each reader gets its own stop event, so a reader still stuck in a blocking read is never revived
+        self._reader_stop = None
+        self._frame_event = threading.Event()
+        self._ring = FrameRing()
+        self._last_sent_seq = 0
+        self._last_encode_time = float('-inf')
+        self._encode_interval = 0.0
+        self._encode_pending = False
+        
+        # MJPEG-over-HTTP sources are forwarded as the camera's own JPEGs, without decoding
+        self._mjpeg_response = None
+        
+        # Event loop (and its event) to wake when the reader publishes a frame
+        self._loop = None
+        self._frame_ready = None
+        
+        # Reusable host buffer for the resized copy (the reader loop keeps its own decode buffer)
+        self._resize_buf = None
+        
+        # Persistent GPU buffers for resizing, allocated on first reader start and reused every frame
+        self._gpu_stream = None
+        self._gpu_src = None
+        self._gpu_dst = None
+        
+        # Downscale step specialized per connection, built whenever the reader starts
+        self._prepare_frame = None
+        
     def get_available_devices(self) -> List[Dict[str, Any]]:
         """Get list of available USB camera devices"""
-        devices = []
+        _load_cv2()
         
-        # Test USB devices 0-9
-        for i in range(10):
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                # Try to read a frame to confirm it works
-                ret, frame = cap.read()
-                if ret and frame is not None:
-                    # Get device info if available
-                    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                    
-                    device_info = {
-                        'index': i,
-                        'name': f'Camera {i}',
-                        'resolution': f'{width}x{height}',
-                        'available': True
-                    }
-                    devices.append(device_info)
-                cap.release()
+        # Test USB devices 0-9, skipping nodes we know don't exist
+        candidates = {i: None for i in range(10)}
+        if platform.system() == 'Linux':
+            candidates = self._list_linux_video_devices()
+        
+        if not candidates:
+            return []
+        
+        # Each open blocks on driver negotiation, so probe all indices in parallel
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            results = list(executor.map(self._probe_index, candidates.keys(), candidates.values()))
+        
+        return [device for device in results if device]
+    
+    def _list_linux_video_devices(self) -> Dict[int, Optional[str]]:
+        """Map /dev/video* capture indices to device names without opening them"""
+        devices = {}
+        
+        # v4l2-ctl lists the capture node first for each device, followed by metadata nodes
+        try:
+            output = subprocess.run(['v4l2-ctl', '--list-devices'], capture_output=True, text=True, timeout=2).stdout
+            name = None
+            for line in output.splitlines():
+                if line and not line[0].isspace():
+                    name = line.split(' (')[0].rstrip(':')
+                    continue
+                match = re.match(r'\s*/dev/video(\d+)$', line)
+                if match and name is not None:
+                    devices[int(match.group(1))] = name
+                    name = None
+            if devices:
+                return devices
+        except (OSError, subprocess.SubprocessError):
+            pass
         
+        for path in glob.glob('/dev/video*'):
+            match = re.match(r'/dev/video(\d+)$', path)
+            if match:
+                devices[int(match.group(1))] = None
         return devices
     
+    def _probe_index(self, i: int, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Open a USB camera index and report it if it delivers frames"""
+        cap = cv2.VideoCapture(i, USB_BACKEND)
+        try:
+            if not cap.isOpened():
+                return None
+            
+            # Try to read a frame to confirm it works
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                return None
+            
+            # Get device info if available
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            
+            return {
+                'index': i,
+                'name': name or f'Camera {i}',
+                'resolution': f'{width}x{height}',
+                'available': True
+            }
+        finally:
+            cap.release()
+    
     def initialize_camera(self, settings: Dict[str, Any]) -> Dict[str, Any]:
         """Initialize camera connection based on type"""
         try:
+            _load_cv2()
+            
             # Clean up any existing camera connection
+            self._stop_reader()
             if self.cap:
                 self.cap.release()
                 self.cap = None
+            self._close_mjpeg_passthrough()
                 
             self.camera_settings = settings
             self.camera_type = settings.get('type', 'rtsp')
             self.frame_count = 0
             
             if self.camera_type == 'rtsp':
-                return self._initialize_rtsp_camera(settings)
+                result = self._initialize_rtsp_camera(settings)
             elif self.camera_type == 'usb':
-                return self._initialize_usb_camera(settings)
+                result = self._initialize_usb_camera(settings)
             elif self.camera_type == 'mjpeg':
-                return self._initialize_mjpeg_camera(settings)
+                result = self._initialize_mjpeg_camera(settings)
             elif self.camera_type == 'http':
-                return self._initialize_http_camera(settings)
+                result = self._initialize_http_camera(settings)
             else:
                 return {"success": False, "error": f"Unsupported camera type: {self.camera_type}"}
+            
+            if result.get("success"):
+                self._start_reader()
+            return result
                 
         except Exception as e:
             return {"success": False, "error": f"Camera initialization error: {str(e)}"}
     
+    def _target_fps(self) -> Optional[float]:
+        """Frame rate the client actually needs, from targetFps or the refresh rate in ms"""
+        target_fps = self.camera_settings.get('targetFps')
+        if target_fps:
+            return float(target_fps)
+        refresh_rate = self.camera_settings.get('refreshRate')
+        if refresh_rate:
+            return 1000.0 / float(refresh_rate)
+        return None
+    
+    def _apply_target_fps(self, cap):
+        """Ask the camera to produce only the frame rate we need, and report if it refuses"""
+        target_fps = self._target_fps()
+        if not target_fps:
+            return
+        
+        cap.set(cv2.CAP_PROP_FPS, target_fps)
+        actual_fps = cap.get(cv2.CAP_PROP_FPS)
+        if actual_fps and actual_fps - target_fps > 0.5:
+            print(f"Camera runs at {actual_fps:.1f} fps instead of the requested {target_fps:.1f} fps; "
+                  "excess frames will be dropped")
+        elif actual_fps and target_fps - actual_fps > 0.5:
+            print(f"Camera runs at {actual_fps:.1f} fps, slower than the requested {target_fps:.1f} fps")
+    
+    def _start_reader(self):
+        """Start the background thread that drains the capture into the frame ring"""
+        self._reader_stop = threading.Event()
+        self._frame_event.clear()
+        self._last_sent_seq = self._ring.head
+        self._last_encode_time = float('-inf')
+        self._encode_pending = False
+        if CUDA_AVAILABLE and self._gpu_stream is None:
+            self._gpu_stream = cv2.cuda.Stream()
+            self._gpu_src = cv2.cuda_GpuMat()
+        self._prepare_frame = self._frame_preparer()
+        if self._mjpeg_response is not None:
+            self._reader_thread = threading.Thread(target=self._mjpeg_reader_loop,
+                                                   args=(self._mjpeg_response, self._reader_stop), daemon=True)
+        else:
+            self._reader_thread = threading.Thread(target=self._reader_loop, args=(self.cap, self._reader_stop),
+                                                   daemon=True)
+        self._reader_thread.start()
+    
+    def _stop_reader(self):
+        """Stop the reader thread, which takes over releasing the capture it reads from"""
+        if self._reader_thread:
+            self._reader_stop.set()
+            # Closing the HTTP response unblocks a passthrough reader waiting on the socket
+            self._close_mjpeg_passthrough()
+            self._reader_thread.join(timeout=2.0)
+            self._reader_thread = None
+            # A reader blocked in grab() past the join releases the capture itself once the read times out
+            self.cap = None
+    
+    def is_opened(self) -> bool:
+        """Whether a capture or MJPEG passthrough stream is currently connected"""
+        if self._mjpeg_response is not None:
+            return True
+        return self.cap is not None and self.cap.isOpened()
+    
+    def _wants_frame(self) -> bool:
+        """Whether a stream is running, due for its next frame and not still encoding the last one"""
+        return (self.streaming and not self._encode_pending
+                and time.monotonic() - self._last_encode_time >= self._encode_interval)
+    
+    def _submit(self, frame):
+        """Queue a frame for the registry's batch encoder, downscaling it first if needed"""
+        # The frame's buffers are reused only after _finish_encode clears the pending flag
+        self._encode_pending = True
+        self.registry.submit(self, self._prepare_frame(frame))
+    
+    def _finish_encode(self, jpeg):
+        """Called by the registry's encoder thread with the JPEG for the submitted frame"""
+        self._encode_pending = False
+        if jpeg is not None:
+            self._publish(jpeg)
+    
+    def _publish(self, jpeg):
+        """Hand an encoded frame to the streaming loop through the ring"""
+        self._ring.write(jpeg)
+        self._last_encode_time = time.monotonic()
+        self._frame_event.set()
+        self._notify_loop()
+    
+    def _reader_loop(self, cap, stop: threading.Event):
+        """Grab frames as fast as the camera delivers them, encoding only the ones a stream needs"""
+        try:
+            # Bound methods resolved once; this loop runs for every frame the camera delivers
+            grab = cap.grab
+            retrieve = cap.retrieve
+            stopped = stop.is_set
+            wants_frame = self._wants_frame
+            submit = self._submit
+            frame_buf = None
+            
+            while not stopped():
+                if not grab():
+                    time.sleep(0.01)
+                    continue
+                
+                # A grab that outlasted the stop must not publish into the next connection's ring
+                if stopped():
+                    break
+                
+                # Grabbed frames that nobody will send are dropped without being decoded
+                if not wants_frame():
+                    continue
+                
+                ret, frame = retrieve(frame_buf)
+                if not ret or frame is None:
+                    continue
+                frame_buf = frame
+                
+                try:
+                    submit(frame)
+                except Exception as e:
+                    self._encode_pending = False
+                    print(f"Error preparing frame: {e}")
+        finally:
+            # Released on this thread, so it is never freed while a grab() is still running on it
+            cap.release()
+    
+    def _mjpeg_reader_loop(self, response, stop: threading.Event):
+        """Split a multipart MJPEG HTTP stream into JPEG images, keeping only the newest one"""
+        pending = bytearray()
+        resume = None
+        try:
+            # chunk_size=None yields whatever has arrived, instead of blocking until a fixed size fills
+            for chunk in response.iter_content(chunk_size=None):
+                if stop.is_set():
+                    break
+                pending += chunk
+                
+                # Images are delimited by their SOI/EOI markers, whatever the part headers say
+                latest = None
+                consumed = 0
+                while True:
+                    start = pending.find(b'\xff\xd8', consumed)
+                    if start < 0:
+                        # A trailing 0xFF may be the first half of the next SOI
+                        consumed = max(consumed, len(pending) - 1)
+                        break
+                    # An image left incomplete by the last chunk is walked on from where it stopped
+                    end, resume = _jpeg_end(pending, start, resume if start == 0 else None)
+                    if end < 0:
+                        consumed = start
+                        if len(pending) - start > MAX_MJPEG_IMAGE_BYTES:
+                            consumed = start + 2
+                            resume = None
+                        elif start:
+                            resume = (resume[0] - start, resume[1])
+                        break
+                    if end == 0:
+                        # Malformed image; resynchronize on the next SOI
+                        consumed = start + 2
+                        continue
+                    latest = (start, end)
+                    consumed = end
+                
+                if latest is not None and self._wants_frame():
+                    with memoryview(pending)[latest[0]:latest[1]] as image:
+                        self._publish_passthrough(image)
+                del pending[:consumed]
+        except Exception as e:
+            if not stop.is_set():
+                print(f"MJPEG passthrough stream error: {e}")
+    
+    def _publish_passthrough(self, image):
+        """Publish a camera JPEG as-is, re-encoding only when it needs downscaling"""
+        size = _jpeg_size(image)
+        if size is not None and size[0] <= MAX_FRAME_WIDTH:
+            self._publish(image)
+            return
+        
+        frame = cv2.imdecode(np.frombuffer(bytes(image), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            self._submit(frame)
+    
+    def _notify_loop(self):
+        """Wake the streaming loop, if one is watching, from the reader thread"""
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._frame_ready.set)
+            except RuntimeError:
+                # The streaming loop closed between the check and the call
+                pass
+    
+    def watch_frames(self, encode_interval: float = 0.0) -> asyncio.Event:
+        """Return an asyncio.Event the reader thread sets on the running loop for each new frame"""
+        self._encode_interval = encode_interval
+        self._frame_ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._frame_event.is_set():
+            self._frame_ready.set()
+        return self._frame_ready
+    
+    def unwatch_frames(self):
+        """Stop notifying the streaming loop about new frames"""
+        self._loop = None
+    
     def _initialize_rtsp_camera(self, settings: Dict[str, Any]) -> Dict[str, Any]:
         """Initialize RTSP camera (IP cameras, Tapo, etc.)"""
         ip = settings.get('ip', '')
@@ -79,31 +633,30 @@ class UniversalCameraStream:
         if not ip:
             return {"success": False, "error": "IP address is required for RTSP cameras"}
         
-        # Common RTSP URL patterns
-        rtsp_urls = [
-            f"rtsp://{username}:{password}@{ip}:{port}/stream1",
-            f"rtsp://{username}:{password}@{ip}:{port}/stream2",
-            f"rtsp://{username}:{password}@{ip}/stream1",
-            f"rtsp://{username}:{password}@{ip}/stream2",
-            f"rtsp://{username}:{password}@{ip}:{port}/h264",
-            f"rtsp://{username}:{password}@{ip}:{port}/live",
-            f"rtsp://{username}:{password}@{ip}:{port}/video.mp4"
-        ]
+        # Must be set before FFmpeg opens the stream; an explicit user setting wins
+        os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', RTSP_FFMPEG_OPTIONS)
         
-        return self._test_urls(rtsp_urls, f"RTSP camera at {ip}", password)
+        params = {'ip': ip, 'port': port, 'username': username, 'password': password}
+        return self._connect_templates('rtsp', self._RTSP_TEMPLATES, params,
+                                       f"RTSP camera at {ip}", password, stream_format='h264')
     
     def _initialize_usb_camera(self, settings: Dict[str, Any]) -> Dict[str, Any]:
         """Initialize USB camera"""
         device_index = settings.get('usbDevice', 0)
         
         try:
-            cap = cv2.VideoCapture(device_index)
+            cap = cv2.VideoCapture(device_index, USB_BACKEND)
             
             if not cap.isOpened():
                 return {"success": False, "error": f"Could not open USB camera at index {device_index}"}
             
             # Set buffer size to reduce latency
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if not cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
+                print(f"Warning: {cap.getBackendName()} backend ignored CAP_PROP_BUFFERSIZE; "
+                      "relying on the reader thread to drain queued frames")
+            
+            # Ask for in-camera MJPEG so full frames don't saturate the USB link
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
             
             # Set resolution if specified
             resolution = settings.get('resolution', 'auto')
@@ -112,6 +665,8 @@ class UniversalCameraStream:
                 cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
                 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
             
+            self._apply_target_fps(cap)
+            
             # Test frame capture
             ret, frame = cap.read()
             if not ret or frame is None:
@@ -120,6 +675,7 @@ class UniversalCameraStream:
             
             self.cap = cap
             self.camera_url = f"USB Device {device_index}"
+            self._display_url = self.camera_url
             
             # Get actual resolution
             width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -144,17 +700,45 @@ class UniversalCameraStream:
         if not ip:
             return {"success": False, "error": "IP address is required for MJPEG cameras"}
         
-        # Common MJPEG URL patterns
-        mjpeg_urls = [
-            f"http://{ip}:{port}/video.mjpg",
-            f"http://{ip}:{port}/mjpg/video.mjpg",
-            f"http://{ip}:{port}/video.cgi",
-            f"http://{ip}:{port}/mjpeg",
-            f"http://{ip}:{port}/video",
-            f"http://{ip}:{port}/stream.mjpg"
-        ]
+        params = {'ip': ip, 'port': port, 'username': '', 'password': ''}
+        result = self._connect_templates('mjpeg', self._MJPEG_TEMPLATES, params,
+                                         f"MJPEG camera at {ip}", stream_format='mjpeg')
+        
+        if not result["success"]:
+            return result
+        
+        # Forward the camera's JPEGs directly instead of decoding and re-encoding them. Single-client
+        # cameras (ESP32-CAM) refuse a second connection, so the capture is released first
+        url = self.camera_url
+        self.cap.release()
+        self.cap = None
+        if self._open_mjpeg_passthrough(url):
+            print(f"Forwarding MJPEG stream from {ip} without re-encoding")
+            return result
+        
+        return self._test_urls([url], f"MJPEG camera at {ip}", stream_format='mjpeg')
+    
+    def _open_mjpeg_passthrough(self, url: str) -> bool:
+        """Open the URL as a raw multipart JPEG HTTP stream, if that's what it serves"""
+        import requests
         
-        return self._test_urls(mjpeg_urls, f"MJPEG camera at {ip}")
+        try:
+            response = requests.get(url, stream=True, timeout=5)
+            content_type = response.headers.get('Content-Type', '')
+            if response.ok and content_type.startswith('multipart/'):
+                self._mjpeg_response = response
+                return True
+            response.close()
+        except requests.RequestException as e:
+            print(f"MJPEG passthrough unavailable for {url}: {e}")
+        return False
+    
+    def _close_mjpeg_passthrough(self):
+        """Close the passthrough HTTP stream, if open"""
+        response = self._mjpeg_response
+        self._mjpeg_response = None
+        if response is not None:
+            response.close()
     
     def _initialize_http_camera(self, settings: Dict[str, Any]) -> Dict[str, Any]:
         """Initialize HTTP camera with custom URL"""
@@ -165,122 +749,423 @@ class UniversalCameraStream:
         
         return self._test_urls([custom_url], "HTTP camera")
     
-    def _test_urls(self, urls: List[str], camera_description: str, password_to_hide: str = None) -> Dict[str, Any]:
+    def _connect_templates(self, camera_type: str, templates, params: Dict[str, str], camera_description: str,
+                           password_to_hide: str = None, stream_format: Optional[str] = None) -> Dict[str, Any]:
+        """Connect using the cached URL template if it still works, otherwise probe every template"""
+        cache_key = hashlib.sha1(
+            f"{camera_type}|{params['ip']}|{params['port']}|{params['username']}".encode()
+        ).hexdigest()
+        
+        cached = self._url_cache.get(cache_key)
+        if cached:
+            result = self._test_urls([cached.format(**params)], camera_description, password_to_hide, stream_format)
+            if result["success"]:
+                return result
+        
+        urls = [template.format(**params) for template in templates]
+        result = self._test_urls(urls, camera_description, password_to_hide, stream_format)
+        if result["success"]:
+            self._remember_url(cache_key, templates[urls.index(self.camera_url)])
+        return result
+    
+    def _load_url_cache(self) -> Dict[str, str]:
+        """Load the working-URL cache, treating a missing or corrupt file as empty"""
+        try:
+            with open(self._url_cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _remember_url(self, cache_key: str, template: str):
+        """Persist the template that worked for a camera, replacing the cache file atomically"""
+        if self._url_cache.get(cache_key) == template:
+            return
+        
+        self._url_cache[cache_key] = template
+        try:
+            self._url_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._url_cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._url_cache, f)
+            os.replace(tmp_path, self._url_cache_path)
+        except OSError as e:
+            print(f"Could not save camera URL cache: {e}")
+    
+    def _test_urls(self, urls: List[str], camera_description: str, password_to_hide: str = None,
+                   stream_format: Optional[str] = None) -> Dict[str, Any]:
         """Test multiple URLs and return success with the first working one"""
+        urls = self._prune_dead_http_urls(urls)
+        
+        # Hardware-decoding GStreamer pipelines first, plain URLs (FFmpeg, CPU decode) as fallback
+        gstreamer_candidates = []
+        target_fps = self._target_fps()
         for url in urls:
-            try:
-                print(f"Testing {camera_description}: {url.replace(password_to_hide, '***') if password_to_hide else url}")
-                
-                cap = cv2.VideoCapture(url)
+            pipeline = _gstreamer_pipeline(url, stream_format, target_fps)
+            if pipeline:
+                gstreamer_candidates.append((url, pipeline, cv2.CAP_GSTREAMER))
+        plain_candidates = [(url, url, cv2.CAP_ANY) for url in urls]
+        
+        for candidates in (gstreamer_candidates, plain_candidates):
+            if not candidates:
+                continue
+            
+            result = self._probe_concurrently(candidates, camera_description, password_to_hide)
+            if result:
+                url, cap, width, height, fps = result
+                self.cap = cap
+                self.camera_url = url
+                self._display_url = _redact_url(url, password_to_hide)
                 
-                # Set timeouts
-                cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 5000)
-                cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 5000)
-                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                # GStreamer pipelines already rate-limit with videorate
+                if candidates is plain_candidates:
+                    self._apply_target_fps(cap)
+                    fps = cap.get(cv2.CAP_PROP_FPS)
                 
-                # Set resolution if specified
-                resolution = self.camera_settings.get('resolution', 'auto')
-                if resolution != 'auto':
-                    width, height = map(int, resolution.split('x'))
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                print(f"Successfully connected to {camera_description}")
                 
-                if cap.isOpened():
-                    ret, frame = cap.read()
-                    if ret and frame is not None:
-                        self.cap = cap
-                        self.camera_url = url
-                        
-                        # Get camera properties
-                        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        fps = cap.get(cv2.CAP_PROP_FPS)
-                        
-                        print(f"Successfully connected to {camera_description}")
-                        
-                        # Clean up the test frame
-                        del frame
-                        
-                        return {
-                            "success": True,
-                            "resolution": f"{width}x{height}",
-                            "fps": fps,
-                            "url": url.replace(password_to_hide, '***') if password_to_hide else url
-                        }
-                    else:
-                        cap.release()
-                else:
-                    cap.release()
-                    
-            except Exception as e:
-                print(f"Error testing {url}: {e}")
-                continue
+                return {
+                    "success": True,
+                    "resolution": f"{width}x{height}",
+                    "fps": fps,
+                    "url": self._display_url
+                }
         
         return {"success": False, "error": f"Failed to connect to {camera_description} with any URL"}
     
-    def capture_frame(self) -> Optional[str]:
-        """Capture a single frame and return as base64 encoded JPEG"""
-        if not self.cap or not self.cap.isOpened():
-            return None
-            
+    def _prune_dead_http_urls(self, urls: List[str]) -> List[str]:
+        """Drop HTTP URLs whose server refuses the connection or 404s, before any OpenCV open attempt"""
+        http_urls = [url for url in urls if url.startswith(('http://', 'https://'))]
+        if not http_urls:
+            return urls
+        
         try:
-            ret, frame = self.cap.read()
-            
-            if not ret or frame is None:
-                return None
+            import httpx
+        except ImportError:
+            return urls
+        
+        async def head_all():
+            # One pooled keep-alive client for all probes; they usually target the same host
+            limits = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+            async with httpx.AsyncClient(limits=limits, timeout=5.0) as client:
+                return await asyncio.gather(*(client.head(url) for url in http_urls), return_exceptions=True)
+        
+        try:
+            responses = asyncio.run(head_all())
+        except RuntimeError:
+            # Already inside an event loop; skip the pre-check rather than block it
+            return urls
+        
+        dead = set()
+        for url, response in zip(http_urls, responses):
+            if isinstance(response, (httpx.ConnectError, httpx.ConnectTimeout)):
+                dead.add(url)
+            elif isinstance(response, httpx.Response) and response.status_code == 404:
+                dead.add(url)
+        
+        # Servers that reject HEAD or time out on it may still stream, so only clear failures are dropped
+        return [url for url in urls if url not in dead]
+    
+    def _probe_concurrently(self, candidates, camera_description: str, password_to_hide: str = None):
+        """Probe all candidates at once and return the highest-priority (earliest) one that delivers a frame"""
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        futures = [
+            executor.submit(self._probe_single, url, source, api_preference, camera_description, password_to_hide)
+            for url, source, api_preference in candidates
+        ]
+        winner = None
+        
+        def release_loser(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            result = future.result()
+            if result and result is not winner:
+                result[1].release()
+        
+        try:
+            best = None
+            deadline = None
+            pending = set(futures)
+            # Once a candidate works, earlier (preferred) candidates still connecting get until the
+            # open timeout to finish, so a faster sub-stream can't win over the main stream
+            while pending and (best is None or any(futures.index(f) < best for f in pending)):
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    index = futures.index(future)
+                    if future.result() and (best is None or index < best):
+                        best = index
+                        if deadline is None:
+                            deadline = time.monotonic() + OPEN_TIMEOUT_MS / 1000
+            if best is not None:
+                winner = futures[best].result()
+        finally:
+            # Probes still connecting release their capture as soon as they finish
+            for future in futures:
+                future.add_done_callback(release_loser)
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        return winner
+    
+    def _probe_single(self, url: str, source: str, api_preference: int, camera_description: str,
+                      password_to_hide: str = None):
+        """Open one candidate stream and return (url, cap, width, height, fps) if it delivers a frame"""
+        try:
+            backend = "GStreamer HW decode" if api_preference == cv2.CAP_GSTREAMER else "default backend"
+            print(f"Testing {camera_description} ({backend}): {_redact_url(url, password_to_hide)}")
             
-            self.frame_count += 1
+            cap = cv2.VideoCapture(source, api_preference)
             
-            # Resize frame if too large (for performance)
-            height, width = frame.shape[:2]
-            max_width = 1280  # Configurable max width
+            # Set timeouts
+            cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, OPEN_TIMEOUT_MS)
+            cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 5000)
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
-            if width > max_width:
-                scale = max_width / width
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                frame = cv2.resize(frame, (new_width, new_height))
+            # Set resolution if specified
+            resolution = self.camera_settings.get('resolution', 'auto')
+            if resolution != 'auto':
+                width, height = map(int, resolution.split('x'))
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
             
-            # Encode frame as JPEG with lower quality for better performance
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 75]
-            _, buffer = cv2.imencode('.jpg', frame, encode_param)
+            if cap.isOpened():
+                ret, frame = cap.read()
+                if ret and frame is not None:
+                    # Get camera properties
+                    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                    fps = cap.get(cv2.CAP_PROP_FPS)
+                    return url, cap, width, height, fps
             
-            # Convert to base64
-            frame_base64 = base64.b64encode(buffer).decode('utf-8')
+            cap.release()
+                
+        except Exception as e:
+            print(f"Error testing {_redact_url(url, password_to_hide)}: {e}")
+        
+        return None
+    
+    def capture_frame(self, timeout: float = 1.0) -> Optional[str]:
+        """Capture a single frame and return as base64 encoded JPEG"""
+        if not self.is_opened():
+            return None
             
-            # Explicitly delete the frame and buffer immediately
-            del frame
-            del buffer
+        try:
+            # Wait for the reader thread to publish a frame we haven't sent yet
+            if not self._frame_event.wait(timeout=timeout):
+                return None
+            self._frame_event.clear()
             
-            # Force immediate garbage collection every 50 frames
-            if self.frame_count % 50 == 0:
-                gc.collect()
+            # Base64 straight out of the ring slot, without copying the JPEG first
+            latest = self._ring.read_latest(_b64encode_view, after=self._last_sent_seq)
+            if latest is None:
+                return None
             
+            self._last_sent_seq, frame_base64 = latest
+            self.frame_count += 1
             return frame_base64
             
         except Exception as e:
             print(f"Error capturing frame: {e}")
             return None
     
+    def _frame_preparer(self):
+        """Build the per-frame downscale step, with the target size worked out once per input size"""
+        resize = self._resize
+        pyr_down = cv2.pyrDown
+        on_gpu = self._gpu_stream is not None
+        max_width = MAX_FRAME_WIDTH
+        last_shape = None
+        target_size = None
+        pyr_bufs = []
+        
+        def prepare_frame(frame):
+            nonlocal last_shape, target_size, pyr_bufs
+            # Cameras keep one resolution per connection, so this is recomputed only on the first frame
+            shape = frame.shape
+            if shape != last_shape:
+                height, width = shape[:2]
+                target_size = None
+                pyr_bufs = []
+                if width > max_width:
+                    # Integer math keeps the aspect ratio without float rounding
+                    target_size = (max_width, height * max_width // width)
+                    # Exact 1/2 and 1/4 downscales go through pyrDown's SIMD Gaussian-and-decimate
+                    if not on_gpu and width % max_width == 0 and width // max_width in (2, 4):
+                        halvings = (width // max_width).bit_length() - 1
+                        pyr_bufs = [None] * halvings
+                last_shape = shape
+            
+            if target_size is None:
+                return frame
+            if pyr_bufs:
+                for i, buf in enumerate(pyr_bufs):
+                    frame = pyr_down(frame, dst=buf)
+                    pyr_bufs[i] = frame
+                return frame
+            return resize(frame, target_size)
+        
+        return prepare_frame
+    
+    def _resize(self, frame, size):
+        """Downscale a frame, on the GPU when OpenCV has CUDA support"""
+        if self._gpu_stream is None:
+            if self._resize_buf is None or self._resize_buf.shape[1::-1] != size:
+                self._resize_buf = np.empty((size[1], size[0], frame.shape[2]), dtype=frame.dtype)
+            # INTER_AREA box-filters on downscale: sharper than INTER_LINEAR and faster for integer ratios
+            return cv2.resize(frame, size, dst=self._resize_buf, interpolation=cv2.INTER_AREA)
+        
+        if self._gpu_dst is None or self._gpu_dst.size() != size:
+            self._gpu_dst = cv2.cuda_GpuMat(size[1], size[0], cv2.CV_8UC3)
+        
+        # Upload, resize and download are queued on one stream and synchronized once
+        self._gpu_src.upload(frame, self._gpu_stream)
+        cv2.cuda.resize(self._gpu_src, size, dst=self._gpu_dst, interpolation=cv2.INTER_AREA, stream=self._gpu_stream)
+        resized = self._gpu_dst.download(self._gpu_stream)
+        self._gpu_stream.waitForCompletion()
+        return resized
+    
     def stop_camera(self):
         """Stop camera and release resources"""
         self.streaming = False
         
+        self._stop_reader()
         if self.cap:
             self.cap.release()
             self.cap = None
+        self._close_mjpeg_passthrough()
         
         self.camera_url = None
+        self._display_url = None
         self.camera_type = None
         self.frame_count = 0
         
-        # Force garbage collection
-        gc.collect()
-        
         print("Camera stopped and resources released")
 
-# Global camera instance
-camera = UniversalCameraStream()
+class CameraRegistry:
+    """Active camera streams plus one encoder thread that JPEG-encodes their frames in batches"""
+    
+    def __init__(self):
+        self._instances: Dict[str, UniversalCameraStream] = {}
+        self._instances_lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._cond = threading.Condition()
+        self._encoder_thread = None
+        self._closed = False
+    
+    def create(self, stream_id: str = 'default') -> UniversalCameraStream:
+        """Create and register a camera stream, stopping any stream already registered under the id"""
+        instance = UniversalCameraStream(self, stream_id)
+        with self._instances_lock:
+            previous = self._instances.get(stream_id)
+            self._instances[stream_id] = instance
+        if previous is not None:
+            previous.stop_camera()
+        return instance
+    
+    def get(self, stream_id: str) -> Optional[UniversalCameraStream]:
+        """Look up a registered camera stream"""
+        return self._instances.get(stream_id)
+    
+    def get_or_create(self, stream_id: str) -> UniversalCameraStream:
+        """Look up a camera stream, registering a new one if the id is unknown"""
+        with self._instances_lock:
+            instance = self._instances.get(stream_id)
+            if instance is None:
+                instance = self._instances[stream_id] = UniversalCameraStream(self, stream_id)
+        return instance
+    
+    def remove(self, stream_id: str):
+        """Stop a camera stream and unregister it"""
+        with self._instances_lock:
+            instance = self._instances.pop(stream_id, None)
+        if instance is not None:
+            instance.stop_camera()
+    
+    def submit(self, instance: UniversalCameraStream, frame):
+        """Queue a frame for the next batch; called from the streams' reader threads"""
+        with self._cond:
+            # Also restart an encoder thread that died, or every stream would stall behind it
+            if self._encoder_thread is None or not self._encoder_thread.is_alive():
+                self._closed = False
+                self._encoder_thread = threading.Thread(target=self._encoder_loop, daemon=True)
+                self._encoder_thread.start()
+            self._pending.append((instance, frame))
+            self._cond.notify()
+    
+    def shutdown(self):
+        """Stop every stream and the encoder thread"""
+        for instance in list(self._instances.values()):
+            instance.stop_camera()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._encoder_thread
+            self._encoder_thread = None
+        if thread:
+            thread.join(timeout=2.0)
+    
+    def _encoder_loop(self):
+        """Encode whatever frames are pending as one batch, until shut down"""
+        encode_batch = self._select_encoder()
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                batch, self._pending = self._pending, []
+            
+            try:
+                jpegs = encode_batch([frame for _, frame in batch])
+            except Exception as e:
+                print(f"Error encoding frames: {e}")
+                jpegs = [None] * len(batch)
+            
+            for (instance, _), jpeg in zip(batch, jpegs):
+                try:
+                    instance._finish_encode(jpeg)
+                except Exception as e:
+                    # One stream failing to publish must not take the shared encoder down with it
+                    instance._encode_pending = False
+                    print(f"Error publishing frame for stream {instance.stream_id}: {e}")
+    
+    def _select_encoder(self):
+        """Pick the fastest available batch JPEG encoder (nvImageCodec on NVIDIA GPUs, OpenCV otherwise)"""
+        try:
+            from nvidia import nvimgcodec
+            
+            gpu_encoder = nvimgcodec.Encoder()
+            gpu_params = nvimgcodec.EncodeParams(quality=JPEG_QUALITY)
+            
+            def encode_gpu(frames):
+                # nvImageCodec expects RGB channel order; a list is encoded as one batch
+                rgb = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+                return gpu_encoder.encode(rgb, "jpeg", params=gpu_params)
+            
+            # Make sure the GPU path actually works before committing to it
+            encode_gpu([np.zeros((8, 8, 3), dtype=np.uint8)])
+            print("Using nvImageCodec GPU JPEG encoder")
+            return encode_gpu
+        except Exception:
+            pass
+        
+        encode_param = (int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY)
+        imencode = cv2.imencode
+        
+        def encode_cpu(frames):
+            jpegs = []
+            for frame in frames:
+                ok, buffer = imencode('.jpg', frame, encode_param)
+                jpegs.append(buffer if ok else None)
+            return jpegs
+        
+        return encode_cpu
+
+# Global camera registry and the default camera instance
+registry = CameraRegistry()
+camera = registry.create()
 
 def initialize():
     """Called when plugin is loaded"""
@@ -295,43 +1180,66 @@ def get_available_devices() -> Dict[str, Any]:
     except Exception as e:
         return {"devices": [], "error": str(e)}
 
-def initialize_camera(settings: Dict[str, Any]) -> Dict[str, Any]:
-    """Initialize camera connection"""
-    return camera.initialize_camera(settings)
+def initialize_camera(settings: Dict[str, Any], stream_id: str = 'default') -> Dict[str, Any]:
+    """Initialize camera connection; each stream_id is a separate camera, encoded in one batch with the others"""
+    return registry.get_or_create(stream_id).initialize_camera(settings)
 
-def stop_camera() -> Dict[str, Any]:
+def stop_camera(stream_id: str = 'default') -> Dict[str, Any]:
     """Stop camera streaming"""
-    camera.stop_camera()
+    # The default camera stays registered; other ids are dropped once stopped
+    if stream_id == 'default':
+        camera.stop_camera()
+    else:
+        registry.remove(stream_id)
     return {"success": True}
 
-async def stream_frames(refresh_rate: int = 500):
+async def stream_frames(refresh_rate: int = 500, stream_id: str = 'default'):
     """Async generator for streaming camera frames"""
+    camera = registry.get(stream_id)
+    if camera is None:
+        yield {"error": f"Camera {stream_id} is not initialized", "timestamp": time.time()}
+        return
+    
     camera.streaming = True
     
     # Convert refresh rate from milliseconds to seconds
     delay = max(refresh_rate / 1000.0, 0.01)  # Minimum 10ms
+    delay_ns = int(delay * 1_000_000_000)
     
     consecutive_failures = 0
     max_failures = 5
-    last_frame_time = 0
-    gc_counter = 0
+    last_frame_ns = None
+    
+    # Rate control runs on the monotonic clock, immune to NTP steps and finer than time.time() on Windows;
+    # wall-clock timestamps are derived from a single epoch reading taken here
+    epoch = time.time()
+    start_ns = time.monotonic_ns()
+    
+    # Let the reader encode slightly ahead of the deadline so a frame is ready when it expires
+    frame_ready = camera.watch_frames(encode_interval=delay * 0.9)
     
     try:
         while camera.streaming:
-            current_time = time.time()
-            
             # Enforce frame rate limiting
-            time_since_last = current_time - last_frame_time
-            if time_since_last < delay:
-                await asyncio.sleep(delay - time_since_last)
-                continue
+            if last_frame_ns is not None:
+                ns_since_last = time.monotonic_ns() - last_frame_ns
+                if ns_since_last < delay_ns:
+                    await asyncio.sleep((delay_ns - ns_since_last) / 1_000_000_000)
+            
+            # Sleep until the reader thread signals a new frame instead of polling
+            try:
+                await asyncio.wait_for(frame_ready.wait(), timeout=max(delay, 1.0))
+            except asyncio.TimeoutError:
+                pass
+            frame_ready.clear()
             
-            frame_data = camera.capture_frame()
+            now_ns = time.monotonic_ns()
+            current_time = epoch + (now_ns - start_ns) / 1_000_000_000
+            frame_data = camera.capture_frame(timeout=0)
             
             if frame_data:
                 consecutive_failures = 0  # Reset failure counter
-                last_frame_time = current_time
-                gc_counter += 1
+                last_frame_ns = now_ns
                 
                 yield {
                     "frame": frame_data,
@@ -339,18 +1247,6 @@ async def stream_frames(refresh_rate: int = 500):
                     "frame_count": camera.frame_count,
                     "camera_type": camera.camera_type
                 }
-                
-                # Clear frame_data reference immediately
-                frame_data = None
-                
-                # More aggressive garbage collection
-                if gc_counter % 30 == 0:
-                    gc.collect(0)  # Collect only generation 0 (fastest)
-                    gc_counter = 0
-                    
-                # Full collection less frequently
-                if camera.frame_count % 200 == 0:
-                    gc.collect()  # Full collection
                     
             else:
                 consecutive_failures += 1
@@ -367,38 +1263,39 @@ async def stream_frames(refresh_rate: int = 500):
                     }
                     break
                 
-                # Wait longer on error
-                await asyncio.sleep(min(delay * 2, 2.0))
-                continue
-            
-            # Minimal sleep to yield control
-            await asyncio.sleep(0.001)
+                # Back off exponentially on repeated errors
+                await asyncio.sleep(min(0.05 * 2 ** consecutive_failures, 2.0))
             
     except Exception as e:
         print(f"Streaming error: {e}")
         yield {
             "error": f"Streaming error: {str(e)}",
-            "timestamp": time.time()
+            "timestamp": epoch + (time.monotonic_ns() - start_ns) / 1_000_000_000
         }
     finally:
         camera.streaming = False
-        # Force full cleanup
-        gc.collect()
+        camera.unwatch_frames()
         print("Frame streaming stopped")
 
-def get_camera_status() -> Dict[str, Any]:
+def get_camera_status(stream_id: str = 'default') -> Dict[str, Any]:
     """Get current camera status"""
+    camera = registry.get(stream_id)
+    if camera is None:
+        return {"connected": False, "streaming": False, "frame_count": 0, "camera_type": None, "camera_url": None}
+    
     return {
-        "connected": camera.cap is not None and camera.cap.isOpened(),
+        "connected": camera.is_opened(),
         "streaming": camera.streaming,
         "frame_count": camera.frame_count,
         "camera_type": camera.camera_type,
-        "camera_url": camera.camera_url.replace(camera.camera_settings.get('password', ''), '***') if camera.camera_url else None
+        "camera_url": camera._display_url
     }
 
+# Only reads attributes, so the backend may call it on the event loop instead of a worker thread
+get_camera_status.__ez_inline__ = True
+
 def cleanup():
     """Called when plugin is unloaded"""
-    camera.stop_camera()
-    gc.collect()
+    registry.shutdown()
     print("Universal Camera Viewer plugin cleaned up")
     return {"status": "cleaned"}
\ No newline at end of file
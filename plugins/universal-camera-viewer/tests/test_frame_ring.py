@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+
+
+def test_write_accepts_imencode_result():
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+
+    ok, jpeg = cv2.imencode('.jpg', np.zeros((16, 16, 3), dtype=np.uint8))
+    assert ok
+
+    ring = main.FrameRing()
+    seq = ring.write(jpeg)
+
+    assert ring.read_latest(bytes) == (seq, jpeg.tobytes())
@@ -1,21 +1,49 @@
 import sys
 import subprocess
 import os
+import re
+
+MIN_SETUPTOOLS_VERSION = (68, 0)
+
+def _version_tuple(version):
+    """Turn a version string like '68.2.2' into a comparable tuple of ints"""
+    parts = []
+    for part in version.split('.'):
+        match = re.match(r'\d+', part)
+        if not match:
+            break
+        parts.append(int(match.group()))
+        if match.end() < len(part):
+            # Pre/post-release suffix like '0rc1'; later components don't matter
+            break
+    return tuple(parts)
+
+def setuptools_is_current():
+    """Check the installed setuptools version without importing it or invoking pip"""
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return _version_tuple(version("setuptools")) >= MIN_SETUPTOOLS_VERSION
+    except PackageNotFoundError:
+        return False
 
 def check_python_version():
     """Check if Python version is compatible"""
     version = sys.version_info
     print(f"Python version: {version.major}.{version.minor}.{version.micro}")
     
-    if version.major < 3 or (version.major == 3 and version.minor < 8):
-        print("ERROR: Python 3.8 or higher is required")
+    if version.major < 3 or (version.major == 3 and version.minor < 9):
+        print("ERROR: Python 3.9 or higher is required")
         return False
     
-    if version.major == 3 and version.minor >= 12:
+    if version.major == 3 and version.minor >= 12 and not setuptools_is_current():
         print("Python 3.12+ detected. Installing setuptools first...")
         # For Python 3.12+, we need to ensure setuptools is installed
         try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "--upgrade", "setuptools", "wheel"])
+            subprocess.check_call([
+                sys.executable, "-m", "pip", "install",
+                "--disable-pip-version-check", "--no-input", "--quiet",
+                "--upgrade", "setuptools", "wheel"
+            ])
         except subprocess.CalledProcessError:
             print("ERROR: Failed to install setuptools")
             return False
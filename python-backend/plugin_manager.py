@@ -1,26 +1,173 @@
 import asyncio
+import contextvars
+import io
 import json
 import os
+import re
 import subprocess
 import sys
-import tempfile
-import venv
-from typing import Dict, Any, Optional, AsyncGenerator
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, AsyncGenerator, Awaitable, Callable, Tuple
+import importlib.metadata
 import importlib.util
 import logging
 from pathlib import Path
-import aiofiles
 import base64
-from functools import partial
 import inspect
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:
+    try:
+        from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+    except ImportError:
+        Requirement = None
 
 logger = logging.getLogger(__name__)
 
+# Items a stream may buffer before its producer is made to wait for the websocket to catch up
+STREAM_QUEUE_SIZE = 256
+
+# How much of a pip subprocess's stderr is kept for the failure log
+PIP_STDERR_TAIL_BYTES = 64 * 1024
+
+def _normalize_dist_name(name: str) -> str:
+    """Normalize a distribution name the way pip compares them (PEP 503)"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def _installed_distributions(path: Optional[list] = None) -> Dict[str, str]:
+    """Map normalized distribution names to versions for sys.path, or the given directories"""
+    dists = {}
+    for dist in importlib.metadata.distributions(**({'path': path} if path is not None else {})):
+        name = dist.metadata['Name']
+        if name:
+            # Distributions come in path order; the first one found is the one that gets imported
+            dists.setdefault(_normalize_dist_name(name), dist.version)
+    return dists
+
+async def _run_in_pool(pool: Executor, func, *args, **kwargs):
+    """Run a blocking function on the given pool, keeping the caller's contextvars like asyncio.to_thread"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(pool, partial(ctx.run, func, *args, **kwargs))
+
+class RingBuffer:
+    """Bounded FIFO between a stream's producer and its consumer, with asyncio.Queue's interface
+    
+    bytes-like items of at least min_copy_size bytes are copied into a pool of reusable bytearray
+    slots and handed out as memoryviews of them, so high-rate binary streams don't leave a fresh
+    buffer per item for the allocator and GC; smaller ones are queued as plain bytes. The consumer
+    calls release() when it is done with the items it took.
+    """
+    
+    def __init__(self, maxsize: int, min_copy_size: int = 4 * 1024, pool_bytes: int = 4 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.min_copy_size = min_copy_size
+        self.pool_bytes = pool_bytes
+        self._items: deque = deque()
+        # Slot backing each queued item (None for other items), kept in step with _items
+        self._item_slots: deque = deque()
+        self._free_slots: List[bytearray] = []
+        self._free_bytes = 0
+        self._taken_slots: List[bytearray] = []
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        
+    def empty(self) -> bool:
+        return not self._items
+        
+    def full(self) -> bool:
+        return len(self._items) >= self.maxsize
+        
+    def put_nowait(self, item):
+        if self.full():
+            raise asyncio.QueueFull
+            
+        slot = None
+        if isinstance(item, (bytearray, memoryview)) or (isinstance(item, bytes) and len(item) >= self.min_copy_size):
+            slot, item = self._copy_to_slot(item)
+            
+        self._items.append(item)
+        self._item_slots.append(slot)
+        self._not_empty.set()
+        if self.full():
+            self._not_full.clear()
+            
+    async def put(self, item):
+        while self.full():
+            await self._not_full.wait()
+        self.put_nowait(item)
+        
+    def get_nowait(self):
+        if not self._items:
+            raise asyncio.QueueEmpty
+            
+        item = self._items.popleft()
+        slot = self._item_slots.popleft()
+        if slot is not None:
+            self._taken_slots.append(slot)
+            
+        if not self._items:
+            self._not_empty.clear()
+        self._not_full.set()
+        return item
+        
+    async def get(self):
+        while not self._items:
+            await self._not_empty.wait()
+        return self.get_nowait()
+        
+    def release(self):
+        """Recycle the slots behind every item taken so far; their memoryviews must no longer be used"""
+        # The pool is capped by bytes, so a burst of large items doesn't stay allocated afterwards
+        for slot in self._taken_slots:
+            if self._free_bytes + len(slot) <= self.pool_bytes:
+                self._free_slots.append(slot)
+                self._free_bytes += len(slot)
+        self._taken_slots.clear()
+        
+    def _copy_to_slot(self, data) -> Tuple[Optional[bytearray], Any]:
+        """Copy binary data into a free slot large enough for it (or a new one sized to it) and return a view"""
+        view = memoryview(data).cast('B')
+        size = view.nbytes
+        if size < self.min_copy_size:
+            # A private copy still protects against the producer reusing a mutable buffer
+            return None, view.tobytes()
+            
+        slot = None
+        for i in range(len(self._free_slots) - 1, -1, -1):
+            if len(self._free_slots[i]) >= size:
+                slot = self._free_slots.pop(i)
+                self._free_bytes -= len(slot)
+                break
+        if slot is None:
+            slot = bytearray(size)
+            
+        slot[:size] = view
+        return slot, memoryview(slot)[:size]
+
 class PluginManager:
     def __init__(self):
         self.plugins: Dict[str, PluginInstance] = {}
+        # Loaded plugin ids, rebuilt only when plugins are loaded or unloaded
+        self._plugins_snapshot: Tuple[str, ...] = ()
         self.plugins_dir = Path("plugins")
         self.plugins_dir.mkdir(exist_ok=True)
+        # Plugin code and housekeeping (file writes, pip) get separate pools, so a busy
+        # plugin can't starve installs and loads, and a slow install can't stall plugin calls
+        self.compute_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="plugin-compute")
+        self.io_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="plugin-io")
+        # pip keeps process-wide state (logging, cwd, caches), so in-process installs run one at a time
+        self._pip_lock = threading.Lock()
+        # (deps dir, requirement) pairs installed by this process, and the shared environment's
+        # distributions (read lazily)
+        self._installed_reqs = set()
+        self._installed_dists: Optional[Dict[str, str]] = None
         
     async def initialize(self):
         """Initialize the plugin manager"""
@@ -30,6 +177,8 @@ class PluginManager:
         """Clean up all plugins"""
         for plugin_id in list(self.plugins.keys()):
             await self.unload_plugin(plugin_id)
+        self.compute_pool.shutdown(wait=False)
+        self.io_pool.shutdown(wait=False)
             
     async def load_plugin(self, plugin_id: str, python_code: str, requirements: list) -> Dict[str, Any]:
         """Load a plugin with its Python code"""
@@ -40,19 +189,19 @@ class PluginManager:
             
             # Save Python code first
             main_file = plugin_dir / "main.py"
-            async with aiofiles.open(main_file, 'w') as f:
-                await f.write(python_code)
+            await _run_in_pool(self.io_pool, main_file.write_text, python_code, encoding='utf-8')
             
-            # For now, skip virtual environment creation to simplify
-            # Just install requirements globally if any
+            # Requirements the shared environment lacks go into the plugin's own .deps directory;
+            # no per-plugin virtual environment (and interpreter tree) is built
             if requirements:
-                await self._install_requirements_global(requirements)
+                await self._install_requirements(requirements, plugin_dir / ".deps")
                 
             # Create plugin instance
-            plugin = PluginInstance(plugin_id, plugin_dir, None)
+            plugin = PluginInstance(plugin_id, plugin_dir, self.compute_pool)
             await plugin.load()
             
             self.plugins[plugin_id] = plugin
+            self._plugins_snapshot = tuple(self.plugins)
             
             logger.info(f"Plugin {plugin_id} loaded successfully")
             return {"success": True}
@@ -61,15 +210,8 @@ class PluginManager:
             logger.error(f"Error loading plugin {plugin_id}: {e}")
             return {"success": False, "error": str(e)}
             
-    async def _create_venv(self, venv_dir: Path):
-        """Create virtual environment - FIXED"""
-        loop = asyncio.get_event_loop()
-        # Use partial to pass the arguments correctly
-        create_venv_func = partial(venv.create, str(venv_dir), with_pip=True)
-        await loop.run_in_executor(None, create_venv_func)
-        
-    async def _install_requirements_global(self, requirements: list):
-        """Install requirements globally (simplified approach)"""
+    async def _install_requirements(self, requirements: list, dep_dir: Path):
+        """Install requirements into a plugin's dependency directory"""
         if not requirements:
             return
             
@@ -82,60 +224,127 @@ class PluginManager:
         if not clean_requirements:
             return
             
+        # Skip pip entirely when no requirement needs (or could use) an install
+        local_dists = _installed_distributions([str(dep_dir)]) if dep_dir.is_dir() else {}
+        clean_requirements = [
+            req for req in dict.fromkeys(clean_requirements)
+            if self._needs_install(req, dep_dir, local_dists)
+        ]
+        if not clean_requirements:
+            logger.info("Requirements already satisfied")
+            return
+            
         logger.info(f"Installing requirements: {clean_requirements}")
         
         try:
-            # Create a temporary requirements file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-                f.write('\n'.join(clean_requirements))
-                req_file = f.name
+            # Requirements are passed directly, no temporary requirements file needed
+            returncode = await self._run_pip([
+                'install', '--disable-pip-version-check', '--no-input', '-q',
+                '--upgrade', '--target', str(dep_dir),
+                *clean_requirements
+            ])
             
-            # Install using subprocess
-            process = await asyncio.create_subprocess_exec(
-                sys.executable, '-m', 'pip', 'install', '-r', req_file,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                logger.warning(f"Failed to install some requirements: {stderr.decode()}")
+            if returncode != 0:
+                logger.warning(f"Failed to install some requirements (pip exit code {returncode})")
             else:
+                self._installed_reqs.update((dep_dir, req) for req in clean_requirements)
+                # Path finders may have cached the directory listing from before the install
+                importlib.invalidate_caches()
                 logger.info("Requirements installed successfully")
                 
         except Exception as e:
             logger.warning(f"Error installing requirements: {e}")
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(req_file)
-            except:
-                pass
-                
-    async def _install_requirements(self, venv_dir: Path, requirements: list):
-        """Install requirements in virtual environment"""
-        pip_path = venv_dir / ("Scripts" if sys.platform == "win32" else "bin") / "pip"
-        
-        # Create temporary requirements file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-            f.write('\n'.join(requirements))
-            req_file = f.name
             
+    def _needs_install(self, requirement: str, dep_dir: Path, local_dists: Dict[str, str]) -> bool:
+        """Check a requirement against earlier installs and the distributions the plugin would import"""
+        if (dep_dir, requirement) in self._installed_reqs:
+            return False
+            
+        # Without packaging to parse it, or if it doesn't parse, pip decides
+        if Requirement is None:
+            return True
+        try:
+            req = Requirement(requirement)
+        except InvalidRequirement:
+            return True
+        if req.marker is not None and not req.marker.evaluate():
+            return False
+        # Extras and URL requirements pull in dependencies that can't be checked here, so they're left to pip
+        if req.extras or req.url:
+            return True
+            
+        if self._installed_dists is None:
+            self._installed_dists = _installed_distributions()
+            
+        # The plugin's .deps directory comes last on sys.path, so a distribution in the shared
+        # environment is the one imported, whatever gets installed into .deps
+        name = _normalize_dist_name(req.name)
+        shared_version = self._installed_dists.get(name)
+        if shared_version is not None:
+            if not req.specifier.contains(shared_version, prereleases=True):
+                logger.warning(f"Requirement {requirement} is not installed: the shared environment's "
+                               f"{req.name} {shared_version} would shadow it")
+            return False
+            
+        local_version = local_dists.get(name)
+        return local_version is None or not req.specifier.contains(local_version, prereleases=True)
+        
+    async def _run_pip(self, pip_args: list) -> int:
+        """Run pip in this interpreter on a worker thread, avoiding a Python start-up per install"""
         try:
-            # Install requirements
+            from pip._internal.cli.main import main as pip_main
+        except ImportError:
+            pip_main = None
+            
+        if pip_main is None:
+            # pip isn't importable in this interpreter; fall back to running it as a module
             process = await asyncio.create_subprocess_exec(
-                str(pip_path), 'install', '-r', req_file,
-                stdout=asyncio.subprocess.PIPE,
+                sys.executable, '-m', 'pip', *pip_args,
+                stdout=asyncio.subprocess.DEVNULL,
                 stderr=asyncio.subprocess.PIPE
             )
-            stdout, stderr = await process.communicate()
+            
+            # Drain stderr so pip never blocks on a full pipe, but keep only its tail, where errors are
+            stderr_tail = bytearray()
+            while True:
+                chunk = await process.stderr.read(PIP_STDERR_TAIL_BYTES)
+                if not chunk:
+                    break
+                stderr_tail += chunk
+                del stderr_tail[:-PIP_STDERR_TAIL_BYTES]
+            await process.wait()
             
             if process.returncode != 0:
-                raise Exception(f"Failed to install requirements: {stderr.decode()}")
-                
-        finally:
-            os.unlink(req_file)
+                logger.warning(f"pip error output: {stderr_tail.decode(errors='replace')}")
+            return process.returncode
             
+        def run():
+            with self._pip_lock:
+                # pip's logging setup replaces the root logger's level and handlers process-wide, so
+                # they are put back afterwards; its error output is collected on the 'pip' logger
+                root = logging.getLogger()
+                saved_level, saved_handlers = root.level, root.handlers[:]
+                pip_logger = logging.getLogger('pip')
+                errors = logging.StreamHandler(io.StringIO())
+                errors.setLevel(logging.WARNING)
+                pip_logger.addHandler(errors)
+                try:
+                    returncode = pip_main(pip_args)
+                finally:
+                    pip_logger.removeHandler(errors)
+                    for handler in root.handlers[:]:
+                        root.removeHandler(handler)
+                        handler.close()
+                    root.setLevel(saved_level)
+                    for handler in saved_handlers:
+                        root.addHandler(handler)
+                    
+                if returncode != 0:
+                    logger.warning(f"pip error output: {errors.stream.getvalue()[-PIP_STDERR_TAIL_BYTES:]}")
+                return returncode
+                
+        return await _run_in_pool(self.io_pool, run)
+        
     async def execute_plugin_function(
         self, 
         plugin_id: str, 
@@ -162,8 +371,8 @@ class PluginManager:
         function_name: str,
         args: list,
         kwargs: dict
-    ) -> AsyncGenerator[Any, None]:
-        """Stream data from a plugin function"""
+    ) -> AsyncGenerator[list, None]:
+        """Stream batches of data from a plugin function"""
         plugin = self.plugins.get(plugin_id)
         if not plugin:
             raise Exception(f"Plugin {plugin_id} not loaded")
@@ -171,6 +380,11 @@ class PluginManager:
         async for data in plugin.stream_function(stream_id, function_name, args, kwargs):
             yield data
             
+    def has_function(self, plugin_id: str, function_name: str) -> bool:
+        """Whether a loaded plugin exposes a function with this name"""
+        plugin = self.plugins.get(plugin_id)
+        return plugin is not None and callable(getattr(plugin.module, function_name, None))
+        
     async def stop_stream(self, plugin_id: str, stream_id: str):
         """Stop a streaming operation"""
         plugin = self.plugins.get(plugin_id)
@@ -181,6 +395,7 @@ class PluginManager:
         """Unload a plugin"""
         plugin = self.plugins.pop(plugin_id, None)
         if plugin:
+            self._plugins_snapshot = tuple(self.plugins)
             await plugin.unload()
             logger.info(f"Plugin {plugin_id} unloaded")
             
@@ -190,46 +405,76 @@ class PluginManager:
         if plugin:
             await plugin.stop()
             
-    def get_loaded_plugins(self) -> list:
+    def get_loaded_plugins(self) -> Tuple[str, ...]:
         """Get list of loaded plugins"""
-        return list(self.plugins.keys())
+        return self._plugins_snapshot
 
 
 class PluginInstance:
     """Represents a loaded plugin instance"""
     
-    def __init__(self, plugin_id: str, plugin_dir: Path, venv_dir: Optional[Path]):
+    def __init__(self, plugin_id: str, plugin_dir: Path, executor: Optional[Executor] = None,
+                 max_concurrent_calls: int = 4, max_concurrent_streams: int = 4):
         self.plugin_id = plugin_id
         self.plugin_dir = plugin_dir
-        self.venv_dir = venv_dir
+        # Requirements installed for this plugin alone (pip --target)
+        self.dep_dir = plugin_dir / ".deps"
+        self._dep_path: Optional[str] = None
+        self.module_name = f"plugin_{plugin_id}"
+        # Pool for the plugin's blocking functions; None means asyncio's default executor
+        self.executor = executor
         self.process: Optional[asyncio.subprocess.Process] = None
         self.module = None
-        self.streams: Dict[str, asyncio.Task] = {}
+        self.streams: Dict[str, asyncio.Future] = {}
+        # Admission control: excess calls and streams wait here instead of piling onto the pool.
+        # Streams get their own limit so long-lived streams can't lock out regular calls
+        self._call_semaphore = asyncio.Semaphore(max_concurrent_calls)
+        self._stream_semaphore = asyncio.Semaphore(max_concurrent_streams)
+        # Per-function dispatch resolved on first use, so repeat calls skip lookup and introspection
+        self._call_cache: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._stream_cache: Dict[str, Tuple[Callable, str]] = {}
         
     async def load(self):
         """Load the plugin module"""
-        # Add the plugin directory to Python path temporarily
-        sys.path.insert(0, str(self.plugin_dir))
-        
+        # Plugin dependencies stay importable while the plugin is loaded, since plugins may import lazily.
+        # pip --target also reinstalls transitive dependencies such as numpy into .deps, so the directory
+        # goes last on sys.path, where it can't shadow packages the server already shares
+        dep_path = str(self.dep_dir.resolve())
+        if self.dep_dir.is_dir() and dep_path not in sys.path:
+            self._dep_path = dep_path
+            sys.path.append(dep_path)
+            
+        # Import the plugin module as a package rooted at its directory, so relative imports of
+        # sibling files resolve without putting the directory on the global sys.path
+        spec = importlib.util.spec_from_file_location(
+            self.module_name,
+            self.plugin_dir / "main.py",
+            submodule_search_locations=[str(self.plugin_dir)]
+        )
+        self.module = importlib.util.module_from_spec(spec)
+        self._clear_function_cache()
+        sys.modules[self.module_name] = self.module
         try:
-            # Import the plugin module
-            spec = importlib.util.spec_from_file_location(
-                f"plugin_{self.plugin_id}",
-                self.plugin_dir / "main.py"
-            )
-            self.module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(self.module)
+            # Top-level plugin code may import heavy packages; keep that off the event loop
+            await self._run_in_executor(spec.loader.exec_module, self.module)
+        except BaseException:
+            sys.modules.pop(self.module_name, None)
+            raise
             
-            # Initialize plugin if it has an init function
-            if hasattr(self.module, 'initialize'):
-                result = await self._run_in_executor(self.module.initialize)
-                logger.info(f"Plugin {self.plugin_id} initialization result: {result}")
-        finally:
-            # Remove from path
-            sys.path.remove(str(self.plugin_dir))
+        # Initialize plugin if it has an init function
+        if hasattr(self.module, 'initialize'):
+            result = await self._run_in_executor(self.module.initialize)
+            logger.info(f"Plugin {self.plugin_id} initialization result: {result}")
             
     async def execute_function(self, function_name: str, args: list, kwargs: dict) -> Any:
         """Execute a function in the plugin"""
+        call = self._call_cache.get(function_name) or self._resolve_call(function_name)
+        
+        async with self._call_semaphore:
+            return await call(*args, **kwargs)
+            
+    def _resolve_call(self, function_name: str) -> Callable[..., Awaitable[Any]]:
+        """Look up a plugin function and cache a coroutine function that calls it the right way"""
         if not hasattr(self.module, function_name):
             raise Exception(f"Function {function_name} not found in plugin")
             
@@ -237,71 +482,176 @@ class PluginInstance:
         
         # Check if it's an async function
         if asyncio.iscoroutinefunction(func):
-            return await func(*args, **kwargs)
+            call = func
+        elif getattr(func, '__ez_inline__', False):
+            # Plugins mark cheap getters with __ez_inline__ = True; a thread hop would cost more than the call
+            async def call(*args, **kwargs):
+                result = func(*args, **kwargs)
+                await asyncio.sleep(0)
+                return result
         else:
             # Run in executor to avoid blocking
-            return await self._run_in_executor(func, *args, **kwargs)
+            run_in_executor = self._run_in_executor
+            
+            async def call(*args, **kwargs):
+                return await run_in_executor(func, *args, **kwargs)
+                
+        self._call_cache[function_name] = call
+        return call
         
-    async def stream_function(
-        self, 
-        stream_id: str, 
-        function_name: str, 
-        args: list, 
-        kwargs: dict
-    ) -> AsyncGenerator[Any, None]:
-        """Stream data from a plugin function"""
+    def _resolve_stream(self, function_name: str) -> Tuple[Callable, str]:
+        """Look up a streaming function and cache it with its kind"""
         if not hasattr(self.module, function_name):
             raise Exception(f"Function {function_name} not found in plugin")
             
         func = getattr(self.module, function_name)
         
-        # Create a queue for streaming data
-        queue = asyncio.Queue()
+        if inspect.isasyncgenfunction(func):
+            kind = 'async_generator'
+        elif inspect.isgeneratorfunction(func):
+            kind = 'generator'
+        elif asyncio.iscoroutinefunction(func):
+            kind = 'coroutine'
+        else:
+            kind = 'function'
+            
+        self._stream_cache[function_name] = (func, kind)
+        return func, kind
         
-        # Start the streaming task
-        task = asyncio.create_task(
-            self._run_streaming_function(queue, func, args, kwargs)
-        )
-        self.streams[stream_id] = task
+    def _clear_function_cache(self):
+        """Forget resolved functions, e.g. when the module is (re)loaded or unloaded"""
+        self._call_cache.clear()
+        self._stream_cache.clear()
+        
+    async def stream_function(
+        self, 
+        stream_id: str, 
+        function_name: str, 
+        args: list, 
+        kwargs: dict
+    ) -> AsyncGenerator[list, None]:
+        """Stream data from a plugin function, as lists of the items that were ready together"""
+        func, kind = self._stream_cache.get(function_name) or self._resolve_stream(function_name)
         
+        if not await self._wait_for_stream_slot(stream_id):
+            return
+            
         try:
-            while True:
-                # Get data from queue with timeout
-                try:
-                    data = await asyncio.wait_for(queue.get(), timeout=10.0)
-                except asyncio.TimeoutError:
-                    logger.warning(f"Stream {stream_id} timeout waiting for data")
-                    break
-                
-                # Check for end of stream
-                if data is None:
-                    break
+            # Create a bounded buffer for streaming data, so a fast producer waits instead of buffering without limit
+            queue = RingBuffer(maxsize=STREAM_QUEUE_SIZE)
+            
+            # Start the streaming task
+            task = asyncio.create_task(
+                self._run_streaming_function(queue, func, kind, args, kwargs)
+            )
+            self.streams[stream_id] = task
+            
+            ended = False
+            try:
+                while True:
+                    if queue.empty():
+                        # Wait for the next item or for the producer to finish, whichever comes first,
+                        # so a crashed producer ends the stream at once instead of after the timeout
+                        getter = asyncio.ensure_future(queue.get())
+                        try:
+                            done, _ = await asyncio.wait(
+                                {getter, task}, timeout=10.0, return_when=asyncio.FIRST_COMPLETED
+                            )
+                        finally:
+                            if not getter.done():
+                                getter.cancel()
+                                
+                        if getter not in done:
+                            if task in done:
+                                # Finished without a sentinel; anything it left behind is still drained
+                                if queue.empty():
+                                    break
+                                continue
+                            logger.warning(f"Stream {stream_id} timeout waiting for data")
+                            break
+                        data = getter.result()
+                    else:
+                        # Items already waiting are taken without creating a task or a timer
+                        data = queue.get_nowait()
                     
-                yield data
-                
+                    # Check for end of stream
+                    if data is None:
+                        ended = True
+                        break
+                    
+                    # Coalesce everything else already queued into one batch
+                    batch = [data]
+                    ended = False
+                    while not queue.empty():
+                        data = queue.get_nowait()
+                        if data is None:
+                            ended = True
+                            break
+                        batch.append(data)
+                        
+                    yield batch
+                    # The caller has handled the batch by the time it asks for the next one
+                    queue.release()
+                    if ended:
+                        break
+                        
+                # The sentinel is sent on the producer's way out; re-raise its error, if any, to the caller.
+                # A producer cancelled by stream_stop also sends it, and that is not an error
+                if ended:
+                    await asyncio.wait({task})
+                    if not task.cancelled():
+                        task.result()
+                    
+            finally:
+                # Clean up
+                if not task.done():
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+                self.streams.pop(stream_id, None)
         finally:
-            # Clean up
-            if not task.done():
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
-            self.streams.pop(stream_id, None)
+            self._stream_semaphore.release()
             
-    async def _run_streaming_function(self, queue: asyncio.Queue, func, args, kwargs):
+    async def _wait_for_stream_slot(self, stream_id: str) -> bool:
+        """Take a stream slot, unless the stream is stopped while it waits for one"""
+        if not self._stream_semaphore.locked():
+            return await self._stream_semaphore.acquire()
+            
+        # A placeholder is registered while waiting, so stop_stream also reaches streams that haven't started
+        stopped = asyncio.get_running_loop().create_future()
+        self.streams[stream_id] = stopped
+        acquire = asyncio.ensure_future(self._stream_semaphore.acquire())
+        try:
+            await asyncio.wait({acquire, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            stopped.cancel()
+            raise
+        finally:
+            if self.streams.get(stream_id) is stopped:
+                del self.streams[stream_id]
+            # Stopped (or the caller cancelled) before the stream could start: give back the slot, if taken
+            if stopped.done():
+                if not acquire.done():
+                    acquire.cancel()
+                elif not acquire.cancelled():
+                    self._stream_semaphore.release()
+        return not stopped.done()
+        
+    async def _run_streaming_function(self, queue: RingBuffer, func, kind: str, args, kwargs):
         """Run a streaming function and put results in queue"""
+        cancelled = False
         try:
             # Check if the function is an async generator function
-            if inspect.isasyncgenfunction(func):
+            if kind == 'async_generator':
                 # It's an async generator function (async def with yield)
                 async for data in func(*args, **kwargs):
                     await queue.put(data)
-            elif inspect.isgeneratorfunction(func):
-                # It's a regular generator function (def with yield)
-                for data in func(*args, **kwargs):
-                    await queue.put(data)
-            elif asyncio.iscoroutinefunction(func):
+            elif kind == 'generator':
+                # It's a regular generator function (def with yield); iterate it off the event loop
+                await self._drain_in_thread(func(*args, **kwargs), queue)
+            elif kind == 'coroutine':
                 # It's an async function that might return a generator
                 result = await func(*args, **kwargs)
                 
@@ -311,26 +661,71 @@ class PluginInstance:
                         await queue.put(data)
                 elif hasattr(result, '__iter__'):
                     # It returned a regular generator
-                    for data in result:
-                        await queue.put(data)
+                    await self._drain_in_thread(result, queue)
                 else:
                     raise Exception(f"Async function {func.__name__} did not return a generator")
             else:
                 # It's a regular function that might return a generator
-                result = func(*args, **kwargs)
+                result = await self._run_in_executor(func, *args, **kwargs)
                 
                 if hasattr(result, '__iter__'):
                     # It's a regular generator
-                    for data in result:
-                        await queue.put(data)
+                    await self._drain_in_thread(result, queue)
                 else:
                     raise Exception(f"Function {func.__name__} did not return a generator")
                     
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
         except Exception as e:
             logger.error(f"Error in streaming function: {e}")
             raise
         finally:
-            await queue.put(None)  # Signal end of stream
+            # Signal end of stream; once cancelled nobody reads the queue, so don't wait for room
+            if cancelled:
+                if not queue.full():
+                    queue.put_nowait(None)
+            else:
+                await queue.put(None)
+            
+    async def _drain_in_thread(self, iterable, queue: RingBuffer):
+        """Iterate a blocking iterable on a thread of its own, handing items to the loop's queue"""
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+        
+        def drain():
+            iterator = iter(iterable)
+            try:
+                for data in iterator:
+                    # Block this thread, not the loop, while the queue is full
+                    future = asyncio.run_coroutine_threadsafe(queue.put(data), loop)
+                    while True:
+                        try:
+                            future.result(timeout=0.1)
+                            break
+                        except FutureTimeoutError:
+                            if stop.is_set():
+                                future.cancel()
+                                return
+                    if stop.is_set():
+                        return
+            finally:
+                # Let the generator run its own cleanup (finally blocks) on this thread
+                close = getattr(iterator, 'close', None)
+                if close:
+                    close()
+                    
+        # The drain occupies its thread for the stream's whole lifetime, so it doesn't take one of the
+        # shared compute pool's (cpu_count-sized) workers away from regular calls
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"plugin-stream-{self.plugin_id}")
+        try:
+            await _run_in_pool(pool, drain)
+        except asyncio.CancelledError:
+            # The thread notices between items and closes the generator
+            stop.set()
+            raise
+        finally:
+            pool.shutdown(wait=False)
             
     async def stop_stream(self, stream_id: str):
         """Stop a specific stream"""
@@ -344,8 +739,8 @@ class PluginInstance:
             
     async def stop(self):
         """Stop all plugin operations"""
-        # Cancel all streams
-        for task in self.streams.values():
+        # Cancel all streams, including those still waiting for a slot
+        for task in list(self.streams.values()):
             task.cancel()
             try:
                 await task
@@ -360,13 +755,19 @@ class PluginInstance:
         # Run cleanup if available
         if self.module and hasattr(self.module, 'cleanup'):
             await self._run_in_executor(self.module.cleanup)
+        self._clear_function_cache()
+        
+        # Drop the plugin package and any submodules it imported
+        for name in [name for name in sys.modules if name == self.module_name or name.startswith(self.module_name + '.')]:
+            del sys.modules[name]
+            
+        if self._dep_path is not None:
+            try:
+                sys.path.remove(self._dep_path)
+            except ValueError:
+                pass
+            self._dep_path = None
             
     async def _run_in_executor(self, func, *args, **kwargs):
         """Run a function in executor to avoid blocking"""
-        loop = asyncio.get_event_loop()
-        # Use partial to handle functions with arguments
-        if args or kwargs:
-            func_with_args = partial(func, *args, **kwargs)
-            return await loop.run_in_executor(None, func_with_args)
-        else:
-            return await loop.run_in_executor(None, func)
\ No newline at end of file
+        return await _run_in_pool(self.executor, func, *args, **kwargs)
\ No newline at end of file
@@ -1,11 +1,15 @@
 import asyncio
+import base64
 import json
 import logging
 import os
 import sys
-from typing import Dict, Any, Optional
+import weakref
+from typing import Dict, Any, Optional, Awaitable, Callable, Set
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.websockets import WebSocketState
+import orjson
 import uvicorn
 from plugin_manager import PluginManager
 
@@ -16,6 +20,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Match json.dumps leniency on non-string keys, and let plugins stream NumPy arrays directly
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+async def receive_message(websocket: WebSocket) -> Any:
+    """Receive one JSON message, sent as either a text or a binary frame"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    raw = message.get("bytes")
+    if raw is None:
+        raw = message.get("text")
+    return orjson.loads(raw)
+
+def _encode_binary(obj):
+    """orjson fallback for binary stream items (memoryviews from the stream buffer): base64 strings"""
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(obj).decode('ascii')
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+async def send_message(websocket: WebSocket, payload: Dict[str, Any]):
+    """Send a JSON message as a binary frame, serialized with orjson"""
+    await websocket.send_bytes(orjson.dumps(payload, default=_encode_binary, option=ORJSON_OPTIONS))
+
 app = FastAPI(title="FluidNC Plugin Python Backend")
 
 # Add CORS middleware
@@ -30,8 +57,22 @@ app.add_middleware(
 # Plugin manager instance
 plugin_manager = PluginManager()
 
-# Store active WebSocket connections per plugin
-connections: Dict[str, WebSocket] = {}
+# Store active WebSocket connections per plugin; entries vanish with their socket,
+# so a stream can never keep a closed connection alive
+connections: "weakref.WeakValueDictionary[str, WebSocket]" = weakref.WeakValueDictionary()
+
+def _drop_connection(plugin_id: str, websocket: WebSocket):
+    """Forget a closed connection, unless the plugin has already reconnected on a new one"""
+    if connections.get(plugin_id) is websocket:
+        del connections[plugin_id]
+
+# Stream tasks started over each plugin's connection, cancelled when it disconnects
+connection_tasks: Dict[str, Set[asyncio.Task]] = {}
+
+def _cancel_connection_tasks(plugin_id: str):
+    """Cancel the streams a disconnected client left running"""
+    for task in connection_tasks.pop(plugin_id, set()):
+        task.cancel()
 
 @app.on_event("startup")
 async def startup_event():
@@ -55,127 +96,166 @@ async def websocket_endpoint(websocket: WebSocket, plugin_id: str):
     try:
         while True:
             # Receive message from web client
-            data = await websocket.receive_json()
+            try:
+                data = await receive_message(websocket)
+            except orjson.JSONDecodeError as e:
+                await send_message(websocket, {"type": "error", "error": f"Invalid JSON message: {e}"})
+                continue
             
             # Process the message
             response = await handle_plugin_message(plugin_id, data)
             
             # Send response back
             if response:
-                await websocket.send_json(response)
+                await send_message(websocket, response)
                 
     except WebSocketDisconnect:
         logger.info(f"Plugin {plugin_id} disconnected")
-        connections.pop(plugin_id, None)
+        _drop_connection(plugin_id, websocket)
+        _cancel_connection_tasks(plugin_id)
         await plugin_manager.stop_plugin(plugin_id)
     except Exception as e:
         logger.error(f"Error in WebSocket connection for plugin {plugin_id}: {e}")
-        connections.pop(plugin_id, None)
+        _drop_connection(plugin_id, websocket)
+        _cancel_connection_tasks(plugin_id)
+
+async def _handle_load(plugin_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Load plugin Python code"""
+    result = await plugin_manager.load_plugin(
+        plugin_id, 
+        message.get("pythonCode"),
+        message.get("requirements", [])
+    )
+    return {
+        "id": message.get("id"),
+        "type": "load_response",
+        "success": result["success"],
+        "error": result.get("error")
+    }
+
+async def _handle_execute(plugin_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute plugin function"""
+    result = await plugin_manager.execute_plugin_function(
+        plugin_id,
+        message.get("function"),
+        message.get("args", []),
+        message.get("kwargs", {})
+    )
+    return {
+        "id": message.get("id"),
+        "type": "execute_response",
+        "result": result.get("result"),
+        "error": result.get("error")
+    }
+
+async def _handle_stream_start(plugin_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Start a streaming operation"""
+    stream_id = message.get("streamId")
+    function = message.get("function")
+    args = message.get("args", [])
+    kwargs = message.get("kwargs", {})
+    
+    # Reject up front rather than start a task that can only fail
+    if plugin_id not in plugin_manager.plugins:
+        error = f"Plugin {plugin_id} not loaded"
+    elif not plugin_manager.has_function(plugin_id, function):
+        error = f"Function {function} not found in plugin"
+    else:
+        error = None
+    if error:
+        return {
+            "id": message.get("id"),
+            "type": "stream_start_response",
+            "streamId": stream_id,
+            "success": False,
+            "error": error
+        }
+    
+    # Start streaming in background
+    task = asyncio.create_task(
+        handle_stream(plugin_id, stream_id, function, args, kwargs)
+    )
+    tasks = connection_tasks.setdefault(plugin_id, set())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    
+    return {
+        "id": message.get("id"),
+        "type": "stream_start_response",
+        "streamId": stream_id,
+        "success": True
+    }
+
+async def _handle_stream_stop(plugin_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Stop a streaming operation"""
+    stream_id = message.get("streamId")
+    await plugin_manager.stop_stream(plugin_id, stream_id)
+    return {
+        "id": message.get("id"),
+        "type": "stream_stop_response",
+        "streamId": stream_id,
+        "success": True
+    }
+
+async def _handle_unload(plugin_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Unload plugin"""
+    await plugin_manager.unload_plugin(plugin_id)
+    return {
+        "id": message.get("id"),
+        "type": "unload_response",
+        "success": True
+    }
+
+# Message type -> handler, looked up once per message
+HANDLERS: Dict[str, Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    "load": _handle_load,
+    "execute": _handle_execute,
+    "stream_start": _handle_stream_start,
+    "stream_stop": _handle_stream_stop,
+    "unload": _handle_unload,
+}
 
 async def handle_plugin_message(plugin_id: str, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Handle messages from plugin web clients"""
-    msg_type = message.get("type")
-    msg_id = message.get("id")
+    handler = HANDLERS.get(message.get("type"))
+    if handler is None:
+        return None
     
     try:
-        if msg_type == "load":
-            # Load plugin Python code
-            result = await plugin_manager.load_plugin(
-                plugin_id, 
-                message.get("pythonCode"),
-                message.get("requirements", [])
-            )
-            return {
-                "id": msg_id,
-                "type": "load_response",
-                "success": result["success"],
-                "error": result.get("error")
-            }
-            
-        elif msg_type == "execute":
-            # Execute plugin function
-            result = await plugin_manager.execute_plugin_function(
-                plugin_id,
-                message.get("function"),
-                message.get("args", []),
-                message.get("kwargs", {})
-            )
-            return {
-                "id": msg_id,
-                "type": "execute_response",
-                "result": result.get("result"),
-                "error": result.get("error")
-            }
-            
-        elif msg_type == "stream_start":
-            # Start a streaming operation
-            stream_id = message.get("streamId")
-            function = message.get("function")
-            args = message.get("args", [])
-            kwargs = message.get("kwargs", {})
-            
-            # Start streaming in background
-            asyncio.create_task(
-                handle_stream(plugin_id, stream_id, function, args, kwargs)
-            )
-            
-            return {
-                "id": msg_id,
-                "type": "stream_start_response",
-                "streamId": stream_id,
-                "success": True
-            }
-            
-        elif msg_type == "stream_stop":
-            # Stop a streaming operation
-            stream_id = message.get("streamId")
-            await plugin_manager.stop_stream(plugin_id, stream_id)
-            return {
-                "id": msg_id,
-                "type": "stream_stop_response",
-                "streamId": stream_id,
-                "success": True
-            }
-            
-        elif msg_type == "unload":
-            # Unload plugin
-            await plugin_manager.unload_plugin(plugin_id)
-            return {
-                "id": msg_id,
-                "type": "unload_response",
-                "success": True
-            }
-            
+        return await handler(plugin_id, message)
     except Exception as e:
         logger.error(f"Error handling message for plugin {plugin_id}: {e}")
         return {
-            "id": msg_id,
+            "id": message.get("id"),
             "type": "error",
             "error": str(e)
         }
 
 async def handle_stream(plugin_id: str, stream_id: str, function: str, args: list, kwargs: dict):
     """Handle streaming operations"""
-    websocket = connections.get(plugin_id)
-    if not websocket:
+    if connections.get(plugin_id) is None:
         return
         
     try:
-        async for data in plugin_manager.stream_plugin_function(
+        # Items the plugin produced while the previous frame was being sent go out as one frame
+        async for batch in plugin_manager.stream_plugin_function(
             plugin_id, stream_id, function, args, kwargs
         ):
-            if plugin_id not in connections:
+            # One lookup per batch; stop once the client is gone or its socket is closing
+            websocket = connections.get(plugin_id)
+            if websocket is None or websocket.client_state != WebSocketState.CONNECTED:
                 break
                 
-            await websocket.send_json({
-                "type": "stream_data",
+            await send_message(websocket, {
+                "type": "stream_batch",
                 "streamId": stream_id,
-                "data": data
+                "data": batch
             })
     except Exception as e:
         logger.error(f"Error in stream {stream_id} for plugin {plugin_id}: {e}")
-        if websocket and plugin_id in connections:
-            await websocket.send_json({
+        websocket = connections.get(plugin_id)
+        if websocket is not None and websocket.client_state == WebSocketState.CONNECTED:
+            await send_message(websocket, {
                 "type": "stream_error",
                 "streamId": stream_id,
                 "error": str(e)
@@ -188,4 +268,13 @@ async def health_check():
 
 if __name__ == "__main__":
     port = int(os.getenv("PYTHON_BACKEND_PORT", "8001"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    
+    # libuv-based loop for faster sockets and subprocesses; not available on Windows
+    try:
+        import uvloop
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    logger.info(f"Using {loop} event loop")
+    
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop)
\ No newline at end of file
@@ -12,6 +12,7 @@ class PluginPythonAPI {
     this.reconnectAttempts = 0;
     this.maxReconnectAttempts = 5;
     this.reconnectDelay = 1000;
+    this.textDecoder = new TextDecoder();
     
     // Python backend URL
     this.backendUrl = `ws://localhost:${window.PYTHON_BACKEND_PORT || 8001}/ws/${pluginId}`;
@@ -28,6 +29,8 @@ class PluginPythonAPI {
     return new Promise((resolve, reject) => {
       try {
         this.ws = new WebSocket(this.backendUrl);
+        // Stream data arrives as binary frames of UTF-8 JSON
+        this.ws.binaryType = 'arraybuffer';
 
         this.ws.onopen = () => {
           console.log(`Plugin ${this.pluginId} connected to Python backend`);
@@ -37,7 +40,10 @@ class PluginPythonAPI {
         };
 
         this.ws.onmessage = (event) => {
-          this.handleMessage(event.data);
+          const data = typeof event.data === 'string'
+            ? event.data
+            : this.textDecoder.decode(event.data);
+          this.handleMessage(data);
         };
 
         this.ws.onerror = (error) => {
@@ -90,6 +96,16 @@ class PluginPythonAPI {
         }
       }
       
+      // Handle batched stream messages (several items sent in one frame)
+      if (message.type === 'stream_batch' && message.streamId) {
+        const handler = this.streamHandlers.get(message.streamId);
+        if (handler) {
+          for (const item of message.data) {
+            handler(item);
+          }
+        }
+      }
+      
       // Handle stream errors
       if (message.type === 'stream_error' && message.streamId) {
         const handler = this.streamHandlers.get(message.streamId);
@@ -178,12 +194,19 @@ class PluginPythonAPI {
     // Register stream handler
     this.streamHandlers.set(streamId, onData);
     
-    const response = await this.sendMessage('stream_start', {
-      streamId,
-      function: functionName,
-      args,
-      kwargs
-    });
+    let response;
+    try {
+      response = await this.sendMessage('stream_start', {
+        streamId,
+        function: functionName,
+        args,
+        kwargs
+      });
+    } catch (error) {
+      // Rejected streams (their response carries an error) must not leave their handler behind
+      this.streamHandlers.delete(streamId);
+      throw error;
+    }
     
     if (!response.success) {
       this.streamHandlers.delete(streamId);